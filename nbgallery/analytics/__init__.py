@@ -0,0 +1,12 @@
+"""
+Analytics and batch jobs built on top of the nbgallery database and notebooks.
+
+These modules depend on additional data science packages (scikit-learn, scipy,
+etc.) that are not required for the core database and notebook interfaces;
+install them with pip install nbgallery[analytics].
+
+Submodules:
+ * nbgallery.analytics.topics: streaming topic model over notebook documents
+ * nbgallery.analytics.recommender: precomputed per-user notebook recommendations
+ * nbgallery.analytics.cells: cell-level execution analytics
+"""
@@ -0,0 +1,254 @@
+"""
+Cell-level execution analytics for finding slow and flaky code cells.
+
+The functions here work in bounded memory regardless of the size of the
+executions table:
+
+  * runtime_percentiles() estimates per-cell runtime percentiles from the
+    histogram aggregated in the database (cell_runtime_histogram), so only
+    one row per (cell, bin) is transferred.
+  * CellStats accumulates vectorized per-cell statistics over the chunked
+    execution stream from iter_executions.  Its state grows with the number
+    of cells (and failing user-cell pairs), not the number of executions.
+  * pass_rate_drift() compares recent and earlier pass rates using the
+    server-side executions_trend.
+  * hot_cells() builds a per-notebook report that joins code_cells.cell_number
+    to the cell source in the NotebookDocument.
+
+Requires the analytics extras (pip install nbgallery[analytics]).
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import nbgallery.database.dataframes as nbgdf
+import nbgallery.database.orm as nbgorm
+import nbgallery.notebooks as nbgnb
+
+def runtime_percentiles(hist=None, percentiles=(0.5, 0.9, 0.99), bins=None, **kwargs):
+    """
+    Dataframe with one row per code cell and estimated runtime percentiles
+    (columns p50, p90, p99.5, etc.), linearly interpolated within histogram bins.
+    If hist isn't given, it's fetched with cell_runtime_histogram; keyword
+    arguments are passed along as filters.  Percentiles in the open-ended
+    last bin are reported as its lower edge.
+    """
+    if bins is None:
+        bins = nbgdf.runtime_bins()
+    bins = np.asarray(bins, dtype=float)
+    if hist is None:
+        hist = nbgdf.cell_runtime_histogram(bins=bins.tolist(), **kwargs)
+    counts = hist.pivot_table(index='code_cell_id', columns='bin', values='count', aggfunc='sum', fill_value=0)
+    counts = counts.reindex(columns=range(len(bins)), fill_value=0)
+    matrix = counts.values.astype(float)
+    cumulative = matrix.cumsum(axis=1)
+    total = cumulative[:, -1:]
+    lower = bins
+    upper = np.append(bins[1:], bins[-1])
+
+    result = pd.DataFrame(index=counts.index)
+    result['count'] = total[:, 0].astype(int)
+    for p in percentiles:
+        target = p * total
+        # First bin where the cumulative count reaches the target
+        idx = (cumulative < target).sum(axis=1)
+        idx = np.minimum(idx, len(bins) - 1)
+        rows = np.arange(len(idx))
+        before = np.where(idx > 0, cumulative[rows, np.maximum(idx - 1, 0)], 0)
+        in_bin = matrix[rows, idx]
+        fraction = np.divide(target[:, 0] - before, in_bin, out=np.zeros(len(idx)), where=in_bin > 0)
+        result[f"p{p * 100:g}"] = lower[idx] + fraction * (upper[idx] - lower[idx])
+    return result.reset_index()
+
+class CellStats:
+    """
+    Streaming per-cell execution statistics.  Feed it execution dataframes
+    with update() (e.g. from iter_executions) and read the results with
+    dataframe() and correlated_failures().
+    """
+
+    def __init__(self, bins=None):
+        if bins is None:
+            bins = nbgdf.runtime_bins()
+        self.bins = np.asarray(bins, dtype=float)
+        self.stats = None    # per-cell sums, indexed by code_cell_id
+        self.hist = None     # per-cell runtime histogram counts
+        self.failures = None # (user_id, code_cell_id) => failure count
+
+    @classmethod
+    def from_executions(cls, chunksize=100000, bins=None, **kwargs):
+        """
+        Build statistics over the chunked execution stream; keyword arguments
+        are passed to iter_executions as filters.
+        """
+        stats = cls(bins)
+        for df in nbgdf.iter_executions(chunksize=chunksize, **kwargs):
+            stats.update(df)
+        return stats
+
+    def update(self, df):
+        """
+        Add a chunk of executions (columns as in executions()) to the
+        statistics.
+        """
+        df = df.assign(
+            success=df['success'].astype(float),
+            runtime_sq=df['runtime'] ** 2
+        )
+        grouped = df.groupby('code_cell_id')
+        stats = pd.DataFrame({
+            'notebook_id': grouped['notebook_id'].first(),
+            'cell_number': grouped['cell_number'].first(),
+            'count': grouped.size(),
+            'success': grouped['success'].sum(),
+            'runtime_count': grouped['runtime'].count(),
+            'runtime_sum': grouped['runtime'].sum(),
+            'runtime_sq': grouped['runtime_sq'].sum(),
+            'runtime_min': grouped['runtime'].min(),
+            'runtime_max': grouped['runtime'].max(),
+            'first': grouped['timestamp'].min(),
+            'last': grouped['timestamp'].max()
+        })
+        runtimes = df.dropna(subset=['runtime'])
+        bin_index = np.digitize(runtimes['runtime'].values, self.bins[1:])
+        hist = pd.crosstab(runtimes['code_cell_id'].values, bin_index)
+        hist = hist.reindex(columns=range(len(self.bins)), fill_value=0)
+        failed = df.loc[df['success'] == 0].groupby(['user_id', 'code_cell_id']).size()
+
+        if self.stats is None:
+            self.stats, self.hist, self.failures = stats, hist, failed
+            return self
+        combined = self.stats.reindex(self.stats.index.union(stats.index))
+        new = stats.reindex(combined.index)
+        for column in ['count', 'success', 'runtime_count', 'runtime_sum', 'runtime_sq']:
+            combined[column] = combined[column].fillna(0) + new[column].fillna(0)
+        combined['runtime_min'] = np.fmin(combined['runtime_min'], new['runtime_min'])
+        combined['runtime_max'] = np.fmax(combined['runtime_max'], new['runtime_max'])
+        for column in ['notebook_id', 'cell_number']:
+            combined[column] = combined[column].fillna(new[column])
+        combined['first'] = pd.concat([combined['first'], new['first']], axis=1).min(axis=1)
+        combined['last'] = pd.concat([combined['last'], new['last']], axis=1).max(axis=1)
+        self.stats = combined
+        self.hist = self.hist.add(hist, fill_value=0)
+        self.failures = self.failures.add(failed, fill_value=0)
+        return self
+
+    def dataframe(self, percentiles=(0.5, 0.9, 0.99)):
+        """
+        Dataframe with one row per code cell: execution and user-failure
+        counts, pass rate, runtime mean/std/min/max and estimated percentiles.
+        """
+        if self.stats is None:
+            return pd.DataFrame()
+        s = self.stats
+        df = s[['notebook_id', 'cell_number', 'count']].copy()
+        df['pass_rate'] = s['success'] / s['count']
+        mean = s['runtime_sum'] / s['runtime_count']
+        df['runtime_mean'] = mean
+        df['runtime_std'] = np.sqrt(np.maximum(s['runtime_sq'] / s['runtime_count'] - mean ** 2, 0))
+        df['runtime_min'] = s['runtime_min']
+        df['runtime_max'] = s['runtime_max']
+        if self.failures is not None and len(self.failures):
+            users = self.failures.reset_index().groupby('code_cell_id')['user_id'].nunique()
+            df['failed_users'] = users.reindex(df.index).fillna(0).astype(int)
+        else:
+            df['failed_users'] = 0
+        df['first'] = s['first']
+        df['last'] = s['last']
+
+        hist = self.hist.stack().rename('count').reset_index()
+        hist.columns = ['code_cell_id', 'bin', 'count']
+        pct = runtime_percentiles(hist, percentiles, self.bins.tolist()).set_index('code_cell_id')
+        df = df.join(pct.drop(columns='count'))
+        df.index.name = 'code_cell_id'
+        return df.reset_index()
+
+    def correlated_failures(self, min_users=2, top=100):
+        """
+        Pairs of cells whose failures occur for the same users.  Returns a
+        dataframe of cell pairs with the number of users who saw both fail
+        and the Jaccard similarity of their failing-user sets, computed with
+        a sparse matrix multiply over the user x cell failure matrix.
+        """
+        columns = ['code_cell_id', 'other_code_cell_id', 'users', 'jaccard']
+        if self.failures is None or not len(self.failures):
+            return pd.DataFrame(columns=columns)
+        pairs = self.failures.reset_index()
+        user_ids, rows = np.unique(pairs['user_id'].values, return_inverse=True)
+        cell_ids, cols = np.unique(pairs['code_cell_id'].values, return_inverse=True)
+        F = scipy.sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+            shape=(len(user_ids), len(cell_ids))
+        )
+        both = scipy.sparse.triu(F.T @ F, k=1).tocoo()
+        keep = both.data >= min_users
+        i, j, shared = both.row[keep], both.col[keep], both.data[keep]
+        per_cell = np.asarray(F.sum(axis=0)).ravel()
+        jaccard = shared / (per_cell[i] + per_cell[j] - shared)
+        df = pd.DataFrame({
+            'code_cell_id': cell_ids[i],
+            'other_code_cell_id': cell_ids[j],
+            'users': shared.astype(int),
+            'jaccard': jaccard
+        })
+        return df.sort_values(['jaccard', 'users'], ascending=False).head(top).reset_index(drop=True)
+
+def pass_rate_drift(bucket='week', recent=4, min_count=10, **kwargs):
+    """
+    Dataframe with one row per code cell comparing the pass rate over the
+    most recent `recent` buckets against all earlier buckets.  Counts come
+    from executions_trend, so the aggregation happens in the database.
+    Cells with fewer than min_count executions in either period are dropped.
+    """
+    df = nbgdf.executions_trend(bucket=bucket, by=('code_cell_id',), **kwargs)
+    if df.empty:
+        return pd.DataFrame(columns=['code_cell_id', 'earlier_pass_rate', 'recent_pass_rate', 'drift'])
+    buckets = np.sort(df['bucket'].unique())
+    cutoff = buckets[max(len(buckets) - recent, 0)]
+    df['period'] = np.where(df['bucket'] >= cutoff, 'recent', 'earlier')
+    totals = df.groupby(['code_cell_id', 'period'])[['count', 'success']].sum().unstack('period')
+    totals = totals.dropna()
+    totals = totals[(totals['count'] >= min_count).all(axis=1)]
+    result = pd.DataFrame({
+        'earlier_pass_rate': totals[('success', 'earlier')] / totals[('count', 'earlier')],
+        'recent_pass_rate': totals[('success', 'recent')] / totals[('count', 'recent')],
+    })
+    result['drift'] = result['recent_pass_rate'] - result['earlier_pass_rate']
+    return result.sort_values('drift').reset_index()
+
+def hot_cells(notebook_id, doc=None, session=None, top=10, percentiles=(0.5, 0.9), **kwargs):
+    """
+    Report of the hottest code cells in a notebook, ranked by total runtime
+    across all executions, with pass rate, runtime percentiles and the cell
+    source.  cell_number is the index of the cell among the notebook's
+    code cells.  The notebook document is loaded through the ORM unless doc is
+    given; keyword arguments are passed along as execution filters.
+    """
+    if doc is None:
+        doc = load_notebook(notebook_id, session)
+    rollup = nbgdf.cell_execution_rollup(notebook_id=notebook_id, **kwargs)
+    if rollup.empty:
+        return rollup
+    pct = runtime_percentiles(percentiles=percentiles, notebook_id=notebook_id, **kwargs)
+    df = rollup.merge(pct.drop(columns='count'), how='left', on='code_cell_id')
+
+    sources = list(doc.code_sources())
+    df['source'] = df['cell_number'].map(lambda n: sources[n] if 0 <= n < len(sources) else None)
+    return df.sort_values('runtime_total', ascending=False).head(top).reset_index(drop=True)
+
+def load_notebook(notebook_id, session=None):
+    """
+    Load the document for a notebook id through the ORM, using the given
+    session or a temporary one.
+    """
+    own_session = session is None
+    session = session or nbgorm.Session()
+    try:
+        model = session.query(nbgorm.Notebook).get(notebook_id)
+        if model is None:
+            raise RuntimeError(f"unknown notebook id {notebook_id}")
+        return nbgnb.from_model(model)
+    finally:
+        if own_session:
+            session.close()
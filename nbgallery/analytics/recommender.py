@@ -0,0 +1,285 @@
+"""
+Precomputed notebook recommendations for every user.
+
+This is a packaged batch version of the docs/recommender.ipynb example using
+item-item collaborative filtering.  User-notebook click counts are turned into
+a sparse implicit-rating matrix, item-item similarity is computed from
+co-occurrence with a sparse matrix multiply, and each user's top-N notebooks
+are scored in fixed-size blocks in parallel across processes.  The result is stored in a compact
+file (a few flat numpy arrays) with O(1) lookup by user id.
+
+Recommendations can be refreshed incrementally: refresh() only rescores users
+with clicks newer than the latest click used in the previous computation.
+
+Requires the analytics extras (pip install nbgallery[analytics]).
+"""
+
+import concurrent.futures
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+import nbgallery.database.dataframes as nbgdf
+
+# Implicit rating weight for each click action (see clicks_rollup_pivot)
+default_weights = {
+    'created': 3.0,
+    'edited': 3.0,
+    'executed': 2.0,
+    'ran': 2.0,
+    'downloaded': 1.0,
+    'viewed': 1.0
+}
+
+def interactions(weights=None, min_date=None, max_date=None, days_ago=None, user_id=None):
+    """
+    Dataframe of user_id, notebook_id and implicit rating, computed as the
+    log of the weighted action counts from clicks_rollup_pivot, along with
+    the time of the last click.
+    """
+    weights = weights or default_weights
+    df = nbgdf.clicks_rollup_pivot(min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id)
+    rating = sum(df[action] * weight for action, weight in weights.items())
+    df['rating'] = np.log1p(rating)
+    return df.loc[df['rating'] > 0, ['user_id', 'notebook_id', 'rating', 'last']]
+
+def interaction_matrix(df):
+    """
+    Build a sparse user x notebook rating matrix from an interactions
+    dataframe.  Returns the matrix and the user and notebook ids for its rows
+    and columns.
+    """
+    user_ids, rows = np.unique(df['user_id'].values, return_inverse=True)
+    notebook_ids, cols = np.unique(df['notebook_id'].values, return_inverse=True)
+    X = scipy.sparse.csr_matrix(
+        (df['rating'].values.astype(np.float32), (rows, cols)),
+        shape=(len(user_ids), len(notebook_ids))
+    )
+    return X, user_ids, notebook_ids
+
+def item_similarity(X):
+    """
+    Notebook x notebook cosine similarity of co-occurrence, computed with a
+    sparse matrix multiply.  The diagonal is zeroed so notebooks don't
+    recommend themselves.
+    """
+    B = (X > 0).astype(np.float32)
+    C = (B.T @ B).tocsr()
+    norms = np.sqrt(C.diagonal())
+    norms[norms == 0] = 1
+    inv = scipy.sparse.diags(1 / norms)
+    S = (inv @ C @ inv).tocsr()
+    S.setdiag(0)
+    S.eliminate_zeros()
+    return S
+
+def score_rows(X, S, n):
+    """
+    Return (indptr, columns, scores) arrays with the top n unseen notebooks
+    for each row of X.  Run in worker processes by top_n().
+    """
+    scores = (X @ S).tocsr()
+    # Don't recommend notebooks the user has already interacted with
+    scores = scores - scores.multiply(X > 0)
+    scores.eliminate_zeros()
+    indptr = [0]
+    columns = []
+    values = []
+    for i in range(scores.shape[0]):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        data = scores.data[start:end]
+        order = np.argsort(-data)[:n]
+        columns.append(scores.indices[start:end][order])
+        values.append(data[order])
+        indptr.append(indptr[-1] + len(order))
+    empty = np.array([], dtype=np.int64)
+    return (
+        np.array(indptr, dtype=np.int64),
+        np.concatenate(columns) if columns else empty,
+        np.concatenate(values) if values else empty.astype(np.float32)
+    )
+
+# Item similarity matrix and n in worker processes, set once per process by
+# the pool initializer in top_n() instead of being sent with every block.
+_worker_state = None
+
+def _init_worker(S, n):
+    global _worker_state
+    _worker_state = (S, n)
+
+def _score_block(X):
+    S, n = _worker_state
+    return score_rows(X, S, n)
+
+def top_n(X, S, n=10, n_jobs=None, block_size=1000):
+    """
+    Score every row of X against the item similarity matrix and return
+    (indptr, columns, scores) arrays with the top n notebooks per row.  Rows
+    are scored in blocks of block_size, in parallel across n_jobs processes,
+    so memory per process is bounded by the score matrix of one block
+    regardless of the number of users.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    blocks = (X[start:start + block_size] for start in range(0, X.shape[0], block_size))
+    if n_jobs == 1 or X.shape[0] <= block_size:
+        results = [score_rows(block, S, n) for block in blocks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(S, n)) as executor:
+            results = list(executor.map(_score_block, blocks))
+    indptr = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    for chunk_indptr, _, _ in results:
+        indptr.append(chunk_indptr[1:] + offset)
+        offset += chunk_indptr[-1]
+    return (
+        np.concatenate(indptr),
+        np.concatenate([r[1] for r in results]) if results else np.array([], dtype=np.int64),
+        np.concatenate([r[2] for r in results]) if results else np.array([], dtype=np.float32)
+    )
+
+class Recommendations:
+    """
+    Top-N notebook recommendations for each user, stored as flat arrays in
+    CSR layout: the recommendations for user_ids[i] are
+    notebook_ids[indptr[i]:indptr[i+1]] with matching scores.
+
+    The watermark is the created_at of the latest click used, in the same
+    (database) time zone as the clicks table, so refresh() can find newer
+    clicks regardless of the local clock.
+    """
+
+    def __init__(self, user_ids, indptr, notebook_ids, scores, watermark=None, n=10):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.notebook_ids = np.asarray(notebook_ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.watermark = watermark
+        self.n = n
+        self.index = {user_id: i for i, user_id in enumerate(self.user_ids.tolist())}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self.index
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load recommendations saved with save().
+        """
+        with np.load(filename) as f:
+            return cls(
+                f['user_ids'],
+                f['indptr'],
+                f['notebook_ids'],
+                f['scores'],
+                datetime.datetime.fromisoformat(str(f['watermark'])) if str(f['watermark']) else None,
+                int(f['n'])
+            )
+
+    def save(self, filename):
+        """
+        Save recommendations to a compressed numpy file.
+        """
+        np.savez_compressed(
+            filename,
+            user_ids=self.user_ids,
+            indptr=self.indptr,
+            notebook_ids=self.notebook_ids,
+            scores=self.scores,
+            watermark=np.array(self.watermark.isoformat() if self.watermark else ''),
+            n=np.array(self.n)
+        )
+
+    def lookup(self, user_id):
+        """
+        Return a list of (notebook_id, score) recommendations for a user, best
+        first.  Unknown users get an empty list.
+        """
+        i = self.index.get(user_id)
+        if i is None:
+            return []
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return list(zip(self.notebook_ids[start:end].tolist(), self.scores[start:end].tolist()))
+
+    def dataframe(self):
+        """
+        Dataframe with one row per (user_id, notebook_id) recommendation and
+        its score and rank, suitable for writing to a database table.
+        """
+        counts = np.diff(self.indptr)
+        ranks = np.arange(len(self.notebook_ids)) - np.repeat(self.indptr[:-1], counts)
+        return pd.DataFrame({
+            'user_id': np.repeat(self.user_ids, counts),
+            'notebook_id': self.notebook_ids,
+            'score': self.scores,
+            'rank': ranks + 1
+        })
+
+    def merge(self, other):
+        """
+        Return new recommendations with the users in other replacing or
+        adding to the users in this set.
+        """
+        keep = ~np.isin(self.user_ids, other.user_ids)
+        lists = [
+            (user_id, self.lookup(user_id)) for user_id in self.user_ids[keep].tolist()
+        ] + [
+            (user_id, other.lookup(user_id)) for user_id in other.user_ids.tolist()
+        ]
+        lists.sort(key=lambda x: x[0])
+        indptr = np.cumsum([0] + [len(recs) for _, recs in lists])
+        return Recommendations(
+            [user_id for user_id, _ in lists],
+            indptr,
+            [nbid for _, recs in lists for nbid, _ in recs],
+            [score for _, recs in lists for _, score in recs],
+            other.watermark,
+            other.n
+        )
+
+def compute(n=10, n_jobs=None, weights=None, user_ids=None, **kwargs):
+    """
+    Compute top-n recommendations for every user (or only the given user_ids)
+    from click data.  Additional keyword arguments (e.g. days_ago) are passed
+    to the click query.
+    """
+    df = interactions(weights, **kwargs)
+    watermark = df['last'].max() if len(df) else None
+    if watermark is not None:
+        watermark = pd.Timestamp(watermark).to_pydatetime()
+    X, users, notebooks = interaction_matrix(df)
+    S = item_similarity(X)
+    if user_ids is not None:
+        rows = np.flatnonzero(np.isin(users, list(user_ids)))
+        X = X[rows]
+        users = users[rows]
+    indptr, columns, scores = top_n(X, S, n, n_jobs)
+    return Recommendations(users, indptr, notebooks[columns], scores, watermark, n)
+
+def changed_users(since):
+    """
+    Return the ids of users with clicks after the given time, or all users
+    with clicks if since is None.
+    """
+    df = nbgdf.user_clicks_rollup(min_date=since)
+    if since is not None:
+        df = df[df['last'] > since]
+    return df['user_id'].tolist()
+
+def refresh(recommendations, n_jobs=None, weights=None, **kwargs):
+    """
+    Incrementally refresh recommendations: only users with clicks after the
+    recommendations' watermark are rescored.  The item similarity matrix
+    is always rebuilt from all click data, since it's cheap relative to
+    scoring every user.
+    """
+    users = changed_users(recommendations.watermark)
+    if not users:
+        return recommendations
+    update = compute(recommendations.n, n_jobs, weights, user_ids=users, **kwargs)
+    return recommendations.merge(update)
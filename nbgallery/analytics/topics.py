@@ -0,0 +1,254 @@
+"""
+Topic model training pipeline over nbgallery notebook documents.
+
+Unlike the batch example in docs/topic_model.ipynb, this pipeline never holds
+the whole corpus in memory.  Notebooks are streamed from the database in
+batches, vectorized with either a HashingVectorizer (stateless, no vocabulary)
+or a persisted vocabulary, and used to train an online LDA model with
+partial_fit.  The trained model remembers which version of each notebook it
+has seen, so after loading a saved model, update() only re-tokenizes notebooks
+that are new or changed since the last run.
+
+Requires the analytics extras (pip install nbgallery[analytics]).
+"""
+
+import collections
+import itertools
+
+import joblib
+import pandas as pd
+import sqlalchemy as sa
+from sklearn.decomposition import LatentDirichletAllocation as LDA
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+import nbgallery.database.orm as nbgorm
+import nbgallery.notebooks as nbgnb
+
+# We're including code, so to avoid getting numeric constants, require that
+# words start with a letter.
+TOKEN_PATTERN = r'(?u)\b[a-z]\w+\b'
+
+def notebook_text(doc):
+    """
+    Text used for topic modeling from a notebook document: all cell sources
+    joined together.
+    """
+    return ' '.join(doc.sources())
+
+def iter_corpus(session, notebook_ids=None, batch_size=500, criterion=None):
+    """
+    Stream (notebook_id, updated_at, text) tuples for notebooks in the
+    database, optionally restricted to a set of ids or an SQL criterion.
+    Unloadable documents are skipped (see nbgallery.notebooks.from_models).
+    """
+    criteria = []
+    if notebook_ids is not None:
+        criteria.append(nbgorm.Notebook.id.in_(notebook_ids))
+    if criterion is not None:
+        criteria.append(criterion)
+    models = nbgorm.iter_keyset(session, nbgorm.Notebook, *criteria, page_size=batch_size)
+    for nb, doc in nbgnb.from_models(models):
+        yield (nb.id, nb.updated_at, notebook_text(doc))
+
+def batches(iterable, size):
+    """
+    Split an iterable into lists of at most size elements.
+    """
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def build_vocabulary(texts, max_features=10000, min_df=2, token_pattern=TOKEN_PATTERN):
+    """
+    Build a vocabulary from an iterable of texts in a single streaming pass.
+    Returns the max_features terms with the highest document frequency among
+    those appearing in at least min_df documents.
+    """
+    analyzer = CountVectorizer(token_pattern=token_pattern).build_analyzer()
+    df = collections.Counter()
+    for text in texts:
+        df.update(set(analyzer(text)))
+    terms = [term for term, count in df.most_common(max_features) if count >= min_df]
+    return sorted(terms)
+
+class TopicModel:
+    """
+    Online LDA topic model over notebook documents.
+
+    If a vocabulary is given (see build_vocabulary), documents are vectorized
+    against it and top_words() can name the topics.  Otherwise a
+    HashingVectorizer with n_features buckets is used, which needs no
+    vocabulary pass at all.  The n_jobs parameter is passed to the LDA model.
+    """
+
+    def __init__(self, n_topics=10, vocabulary=None, n_features=2**18, batch_size=500,
+                 n_jobs=None, token_pattern=TOKEN_PATTERN, random_state=None, **kwargs):
+        if vocabulary is not None:
+            self.vectorizer = CountVectorizer(token_pattern=token_pattern, vocabulary=vocabulary)
+        else:
+            self.vectorizer = HashingVectorizer(
+                token_pattern=token_pattern,
+                n_features=n_features,
+                alternate_sign=False,
+                norm=None
+            )
+        self.lda = LDA(
+            n_components=n_topics,
+            learning_method='online',
+            batch_size=batch_size,
+            n_jobs=n_jobs,
+            random_state=random_state,
+            **kwargs
+        )
+        self.batch_size = batch_size
+        self.seen = {} # notebook id => updated_at when last assigned
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a model saved with save().
+        """
+        return joblib.load(filename)
+
+    def save(self, filename):
+        """
+        Save the model, vocabulary and notebook assignment state to a file.
+        """
+        joblib.dump(self, filename)
+
+    def vectorize(self, texts):
+        """
+        Return the document-term matrix for a list of texts.
+        """
+        return self.vectorizer.transform(texts)
+
+    def partial_fit(self, corpus):
+        """
+        Update the model with one pass over a corpus of (notebook_id,
+        updated_at, text) tuples, one batch at a time.
+        """
+        for batch in batches(corpus, self.batch_size):
+            self.lda.partial_fit(self.vectorize([text for _, _, text in batch]))
+        return self
+
+    def fit(self, corpus_factory, passes=1):
+        """
+        Train the model with one or more passes over a corpus.  Since the
+        corpus is streamed, corpus_factory must be a callable returning a new
+        iterable of (notebook_id, updated_at, text) tuples for each pass;
+        e.g. lambda: iter_corpus(session).
+        """
+        for _ in range(passes):
+            self.partial_fit(corpus_factory())
+        return self
+
+    def assign(self, corpus, train=False):
+        """
+        Compute topic distributions for a corpus of (notebook_id, updated_at,
+        text) tuples and record the notebooks as seen.  If train is set, each
+        batch also updates the model before being assigned, so documents are
+        only tokenized once.  Returns a dataframe with one row per notebook, a
+        column per topic and the dominant topic.
+        """
+        frames = []
+        for batch in batches(corpus, self.batch_size):
+            X = self.vectorize([text for _, _, text in batch])
+            if train:
+                self.lda.partial_fit(X)
+            df = pd.DataFrame(self.lda.transform(X), index=[nbid for nbid, _, _ in batch])
+            frames.append(df)
+            for nbid, updated_at, _ in batch:
+                self.seen[nbid] = updated_at
+        if not frames:
+            return pd.DataFrame(columns=['topic'] + list(range(self.lda.n_components)))
+        df = pd.concat(frames)
+        df.index.name = 'notebook_id'
+        df.insert(0, 'topic', df.values.argmax(axis=1))
+        return df
+
+    def changed_notebooks(self, session):
+        """
+        Return a dict of notebook id => updated_at for notebooks that are new
+        or have been updated since this model last assigned them a topic.
+        Only the id and updated_at columns are queried.
+        """
+        nb = nbgorm.Notebook
+        return {
+            nbid: updated_at for nbid, updated_at in session.query(nb.id, nb.updated_at)
+            if nbid not in self.seen or (updated_at and updated_at != self.seen[nbid])
+        }
+
+    def changed_criterion(self, changed):
+        """
+        SQL criterion selecting the changed notebooks without listing every
+        id: notebooks newer than any seen id or updated after the latest seen
+        updated_at, plus an explicit id list for the (usually few) stragglers
+        that neither condition covers.
+        """
+        nb = nbgorm.Notebook
+        max_id = max(self.seen)
+        updated = [t for t in self.seen.values() if t is not None]
+        since = max(updated) if updated else None
+        stragglers = [
+            nbid for nbid, updated_at in changed.items()
+            if nbid <= max_id and (since is None or updated_at is None or updated_at <= since)
+        ]
+        conditions = [nb.id > max_id]
+        if since is not None:
+            conditions.append(nb.updated_at > since)
+        if stragglers:
+            conditions.append(nb.id.in_(stragglers))
+        return sa.or_(*conditions)
+
+    def update(self, session, train=True):
+        """
+        Incrementally bring the model up to date: stream only new or changed
+        notebooks, optionally train on them with partial_fit, and return
+        their topic assignments.  Typically used on a model loaded with
+        load(), followed by save().
+
+        A model that hasn't seen any notebooks is first fit over the whole
+        corpus, so that early notebooks aren't assigned topics by a barely
+        trained model.  Notebooks whose document can't be loaded are recorded
+        as seen and skipped until their updated_at changes.
+        """
+        changed = self.changed_notebooks(session)
+        if not changed:
+            return self.assign([])
+        if not self.seen:
+            corpus_factory = lambda: iter_corpus(session, batch_size=self.batch_size)
+            if train:
+                self.fit(corpus_factory)
+            df = self.assign(corpus_factory())
+        else:
+            corpus = iter_corpus(session, batch_size=self.batch_size, criterion=self.changed_criterion(changed))
+            df = self.assign((t for t in corpus if t[0] in changed), train=train)
+        for nbid, updated_at in changed.items():
+            if nbid not in df.index:
+                self.seen[nbid] = updated_at
+        return df
+
+    def feature_names(self):
+        """
+        Return the vocabulary terms in column order.  Not available when
+        using the hashing vectorizer.
+        """
+        if isinstance(self.vectorizer, HashingVectorizer):
+            raise RuntimeError('feature names are not available without a vocabulary')
+        vocab = self.vectorizer.vocabulary
+        if isinstance(vocab, dict):
+            return [term for term, _ in sorted(vocab.items(), key=lambda t: t[1])]
+        return list(vocab)
+
+    def top_words(self, n=10):
+        """
+        Return a list with the top n words for each topic.
+        """
+        names = self.feature_names()
+        return [
+            [names[i] for i in topic.argsort()[:-n - 1:-1]]
+            for topic in self.lda.components_
+        ]
@@ -8,11 +8,24 @@ of the following directories (in order of precedence):
   * User config directory (usually ~/.config/nbgallery/ on Linux)
   * Site config direcotries (e.g. /etc/xdg/nbgallery/)
 
+Alternately, set NBGALLERY_CONFIG to the path of a config file.  Individual
+settings can be overridden with environment variables named after the setting
+(e.g. NBGALLERY_MYSQL_HOST) or programmatically with set_config().
+
+The config is loaded lazily the first time a setting is accessed, so code that
+only uses nbgallery.notebooks.from_file (for example) doesn't need a config
+file at all.  Likewise, the database engine isn't created until first use.
+
 The config file must specify mysql server parameters and the cache dir where
 notebook document files are stored.  Optionally, you may instead specify the
 location of the Rails config file, and this module will try to load the
 relevant settings from there.
 
+To run queries against a local snapshot of the analytics tables instead of the
+production mysql server, set use_snapshot (see nbgallery.database.snapshot).
+The snapshot_url is an SQLAlchemy URL and defaults to an SQLite file in the
+user cache directory.
+
 nbgallery:
   rails_config:
   mysql_username:
@@ -21,10 +34,22 @@ nbgallery:
   mysql_port:
   mysql_database:
   notebook_cache_dir:
+  snapshot_url:
+  use_snapshot:
 """
 
-from .loader import config_dirs
-from .loader import config
-from .loader import mysql_username, mysql_password, mysql_host, mysql_port, mysql_database
-from .loader import mysql_url
-from .loader import notebook_cache_dir
+from . import loader
+from .loader import load_config, get_config, set_config, lock_config, get_setting, get_mysql_url
+
+__all__ = [
+    'load_config',
+    'get_config',
+    'set_config',
+    'lock_config',
+    'get_setting',
+    'get_mysql_url'
+]
+
+def __getattr__(name):
+    # config, mysql_url, mysql_host, etc. are loaded lazily on first access
+    return getattr(loader, name)
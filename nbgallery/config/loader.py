@@ -1,58 +1,180 @@
-import appdirs
 import os
-from ruamel.yaml import YAML
-
-# Config file order of precedence:
-#  1. Current directory
-#  2. User config directory
-#  3. Site config directories
-config_dirs = [os.getcwd()]
-config_dirs.append(appdirs.user_config_dir('nbgallery'))
-config_dirs += appdirs.site_config_dir('nbgallery', multipath=True).split(':')
-
-# Load the first nbgallery.yml we find
-yaml = YAML(typ='safe')
-config = {}
-for d in config_dirs:
-    config_file = os.path.join(d, 'nbgallery.yml')
-    if os.path.exists(config_file):
-        with open(config_file) as f:
-            config = yaml.load(f)
-        break
-
-if not config:
-    raise ImportError(f"No nbgallery.yml config file found in the search path: {str(config_dirs)}")
-
-# If the config lists a Rails config file, load that too and look for
-# database configuration -- but our file takes precedence.
-if config['nbgallery'].get('rails_config'):
-    with open(config['nbgallery']['rails_config']) as f:
-        rails_config = yaml.load(f)
-    rails_mysql_config = rails_config.get('mysql', {})
-    rails_directory_config = rails_config.get('directories', {})
-
-    for s in ['username', 'password', 'host', 'port', 'database']:
-        setting = 'mysql_' + s
-        if not config['nbgallery'].get(setting):
-            config['nbgallery'][setting] = rails_mysql_config.get(s)
-
-    if not config['nbgallery'].get('notebook_cache_dir'):
-        config['nbgallery']['notebook_cache_dir'] = rails_directory_config.get('cache') 
-
-# Set mysql server defaults
-if not config['nbgallery']['mysql_host']:
-    config['nbgallery']['mysql_host'] = '127.0.0.1'
-if not config['nbgallery']['mysql_port']:
-    config['nbgallery']['mysql_port'] = '3306'
-
-mysql_username = config['nbgallery']['mysql_username']
-mysql_password = config['nbgallery']['mysql_password']
-mysql_host = config['nbgallery']['mysql_host']
-mysql_port = config['nbgallery']['mysql_port']
-mysql_database = config['nbgallery']['mysql_database']
-notebook_cache_dir = config['nbgallery']['notebook_cache_dir']
-
-mysql_url = 'mysql+mysqldb://' + mysql_username
-if mysql_password:
-    mysql_url += ':' + mysql_password
-mysql_url += '@' + mysql_host + ':' + str(mysql_port) + '/' + mysql_database
+
+import appdirs
+
+# Settings recognized in the nbgallery section of the config
+settings = [
+    'rails_config',
+    'mysql_username',
+    'mysql_password',
+    'mysql_host',
+    'mysql_port',
+    'mysql_database',
+    'notebook_cache_dir',
+    'snapshot_url',
+    'use_snapshot'
+]
+
+# Environment variables: NBGALLERY_CONFIG points at a config file, and
+# NBGALLERY_<SETTING> (e.g. NBGALLERY_MYSQL_HOST) overrides a single setting.
+env_prefix = 'NBGALLERY_'
+
+# The config is loaded on first access and cached here
+_config = None
+_overrides = {}
+
+# Set by lock_config once something holds on to the loaded settings
+_locked_by = None
+
+def search_path():
+    """
+    Config file order of precedence:
+      1. Current directory
+      2. User config directory
+      3. Site config directories
+    """
+    dirs = [os.getcwd()]
+    dirs.append(appdirs.user_config_dir('nbgallery'))
+    dirs += appdirs.site_config_dir('nbgallery', multipath=True).split(':')
+    return dirs
+
+def find_config_file():
+    """
+    Return the config file named by NBGALLERY_CONFIG, or else the first
+    nbgallery.yml in the search path, or None if there isn't one.
+    """
+    if os.environ.get(env_prefix + 'CONFIG'):
+        return os.environ[env_prefix + 'CONFIG']
+    for d in search_path():
+        config_file = os.path.join(d, 'nbgallery.yml')
+        if os.path.exists(config_file):
+            return config_file
+    return None
+
+def read_yaml(filename):
+    # ruamel is only imported if there's actually a file to parse
+    from ruamel.yaml import YAML
+    with open(filename) as f:
+        return YAML(typ='safe').load(f) or {}
+
+def load_config(filename=None, overrides=None):
+    """
+    Build the config from (in order of precedence) overrides, environment
+    variables, the config file and the Rails config file, then fill in
+    defaults.  Returns a dict with the settings in the 'nbgallery' section.
+    """
+    filename = filename or find_config_file()
+    config = read_yaml(filename) if filename else {}
+    nbg = dict(config.get('nbgallery') or {})
+
+    for s in settings:
+        value = os.environ.get(env_prefix + s.upper())
+        if value:
+            nbg[s] = value
+    for s, value in (overrides or {}).items():
+        if value is not None:
+            nbg[s] = value
+
+    # If the config lists a Rails config file, load that too and look for
+    # database configuration -- but our settings take precedence.
+    if nbg.get('rails_config'):
+        rails_config = read_yaml(nbg['rails_config'])
+        rails_mysql_config = rails_config.get('mysql', {})
+        rails_directory_config = rails_config.get('directories', {})
+
+        for s in ['username', 'password', 'host', 'port', 'database']:
+            setting = 'mysql_' + s
+            if not nbg.get(setting):
+                nbg[setting] = rails_mysql_config.get(s)
+
+        if not nbg.get('notebook_cache_dir'):
+            nbg['notebook_cache_dir'] = rails_directory_config.get('cache')
+
+    # Set mysql server defaults
+    if not nbg.get('mysql_host'):
+        nbg['mysql_host'] = '127.0.0.1'
+    if not nbg.get('mysql_port'):
+        nbg['mysql_port'] = '3306'
+
+    # Optional local snapshot of the analytics tables (see nbgallery.database.snapshot).
+    # If use_snapshot is set, nbgallery.database.engine points at the snapshot
+    # instead of the mysql server.
+    if not nbg.get('snapshot_url'):
+        nbg['snapshot_url'] = 'sqlite:///' + os.path.join(appdirs.user_cache_dir('nbgallery'), 'snapshot.db')
+    use_snapshot = nbg.get('use_snapshot')
+    if isinstance(use_snapshot, str):
+        use_snapshot = use_snapshot.lower() in ('1', 'true', 'yes', 'on')
+    nbg['use_snapshot'] = bool(use_snapshot)
+
+    config['nbgallery'] = nbg
+    return config
+
+def get_config():
+    """
+    Return the config, loading it on first access.
+    """
+    global _config
+    if _config is None:
+        _config = load_config(overrides=_overrides)
+    return _config
+
+def set_config(filename=None, **kwargs):
+    """
+    Configure programmatically instead of (or on top of) nbgallery.yml.  Pass
+    a config file and/or individual settings as keyword arguments, e.g.
+    set_config(mysql_username='nbgallery', mysql_database='gallery').  This
+    must be called before the database engine is first used; afterwards the
+    config is locked (see lock_config) and it raises RuntimeError, since
+    existing engines and ORM sessions would keep using the old settings.
+    """
+    global _config, _overrides
+    if _locked_by:
+        raise RuntimeError(f"set_config can't be called after {_locked_by}")
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f"unknown config settings: {sorted(unknown)}")
+    _overrides = kwargs
+    _config = load_config(filename, _overrides)
+    return _config
+
+def lock_config(reason):
+    """
+    Prevent further set_config calls.  Modules that keep state derived from
+    the config (e.g. nbgallery.database when it creates an engine) call this
+    with a description of what was created, used in the error message.
+    """
+    global _locked_by
+    if not _locked_by:
+        _locked_by = reason
+
+def get_setting(name):
+    """
+    Return a single setting from the nbgallery section of the config.
+    """
+    return get_config()['nbgallery'].get(name)
+
+def get_mysql_url():
+    """
+    Return the SQLAlchemy URL for the mysql server.
+    """
+    nbg = get_config()['nbgallery']
+    if not nbg.get('mysql_username') or not nbg.get('mysql_database'):
+        raise RuntimeError(f"mysql_username and mysql_database must be set in config; search path: {str(search_path())}")
+    url = 'mysql+mysqldb://' + nbg['mysql_username']
+    if nbg.get('mysql_password'):
+        url += ':' + nbg['mysql_password']
+    url += '@' + nbg['mysql_host'] + ':' + str(nbg['mysql_port']) + '/' + nbg['mysql_database']
+    return url
+
+def __getattr__(name):
+    # Module-level settings (e.g. loader.mysql_host) are computed on access
+    # so that importing this module doesn't read any files.
+    if name == 'config':
+        return get_config()
+    if name == 'config_dirs':
+        return search_path()
+    if name == 'mysql_url':
+        return get_mysql_url()
+    if name in settings:
+        return get_setting(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
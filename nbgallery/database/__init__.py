@@ -7,20 +7,79 @@ various utility functions.
 For higher-level database access, see the submodules:
  * nbgallery.database.orm: object-relational mapping
  * nbgallery.database.dataframes: commonly used datasets as pandas dataframes
+ * nbgallery.database.snapshot: export analytics tables to a local database
 """
 
 import re
 
-import inflect
 import sqlalchemy as sa
 
-from nbgallery.config import mysql_url
+import nbgallery.config as nbgcfg
 
-# Database connection
-engine = sa.create_engine(mysql_url)
+# Columns of the users table that are safe to expose, omitting
+# authentication-related columns like password.
+user_columns = [
+    'id',
+    'user_name',
+    'email',
+    'first_name',
+    'last_name',
+    'org',
+    'created_at',
+    'updated_at',
+    'sign_in_count',
+    'last_sign_in_at'
+]
 
-# For singular/plural conversions, etc.
-inflector = inflect.engine()
+# Engines are created on first use (see get_engine) so that importing this
+# module doesn't require mysql settings.  Creating one locks the config, since
+# the engine and ORM sessions would keep using the old settings.
+_engines = {}
+_inflector = None
+
+def get_mysql_engine():
+    """
+    Return the engine for the mysql server, creating it on first use.
+    """
+    if 'mysql' not in _engines:
+        _engines['mysql'] = sa.create_engine(nbgcfg.get_mysql_url())
+        nbgcfg.lock_config('the database engine is created')
+    return _engines['mysql']
+
+def get_engine():
+    """
+    Return the engine used for queries, creating it on first use.  If
+    use_snapshot is set in config, this is the local snapshot; otherwise
+    it's the mysql server.
+    """
+    if 'default' not in _engines:
+        if nbgcfg.get_setting('use_snapshot'):
+            _engines['default'] = sa.create_engine(nbgcfg.get_setting('snapshot_url'))
+            nbgcfg.lock_config('the database engine is created')
+        else:
+            _engines['default'] = get_mysql_engine()
+    return _engines['default']
+
+def get_inflector():
+    """
+    Return the inflect engine used for singular/plural conversions, etc.
+    """
+    global _inflector
+    if _inflector is None:
+        import inflect
+        _inflector = inflect.engine()
+    return _inflector
+
+def __getattr__(name):
+    # Database connection: engine, and mysql_engine for the mysql server even
+    # when the snapshot is in use.
+    if name == 'engine':
+        return get_engine()
+    if name == 'mysql_engine':
+        return get_mysql_engine()
+    if name == 'inflector':
+        return get_inflector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def camelize(s):
     """
@@ -39,7 +98,7 @@ def rails_classname_for_table(base, tablename, table):
     Returns Rails conventional class name for a given table.
     The table name is camelized and depluralized; e.g. table_names => TableName
     """
-    return camelize(inflector.singular_noun(tablename))
+    return camelize(get_inflector().singular_noun(tablename))
 
 def rails_collection_name(base, local_cls, referred_cls, constraint):
     """
@@ -47,5 +106,5 @@ def rails_collection_name(base, local_cls, referred_cls, constraint):
     The class name is decamelized and pluralized; e.g ClassName => class_names
     """
     referred_name = referred_cls.__name__
-    return inflector.plural_noun(uncamelize(referred_name))
+    return get_inflector().plural_noun(uncamelize(referred_name))
 
@@ -59,6 +59,67 @@ def add_id_filter(select, column, ids):
     else:
         return select.where(column == ids)
 
+def ratio(numerator, denominator):
+    """
+    SQL expression dividing two counts as floating point.  Multiplying by 1.0
+    avoids integer division on SQLite without a CAST, which mysql doesn't
+    support for FLOAT.
+    """
+    return sa.type_coerce(numerator * sa.literal(1.0) / denominator, sa.Float)
+
+def time_bucket(column, bucket):
+    """
+    SQL expression truncating a timestamp column to the start of an hour,
+    day, week (starting Monday) or month.  The expression depends on the
+    database dialect so it works against mysql as well as a local snapshot.
+    """
+    dialect = db.engine.dialect.name
+    if bucket not in ('hour', 'day', 'week', 'month'):
+        raise ValueError(f"unknown time bucket {bucket}")
+    if dialect == 'mysql':
+        if bucket == 'week':
+            return sa.func.date_format(sa.func.subdate(column, sa.func.weekday(column)), '%Y-%m-%d')
+        formats = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d', 'month': '%Y-%m-01'}
+        return sa.func.date_format(column, formats[bucket])
+    if dialect == 'sqlite':
+        if bucket == 'week':
+            return sa.func.date(column, 'weekday 0', '-6 days')
+        formats = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d', 'month': '%Y-%m-01'}
+        return sa.func.strftime(formats[bucket], column)
+    return sa.func.date_trunc(bucket, column)
+
+def trend_select(bucket_expr, group_columns, count_columns, top_k=None):
+    """
+    Build a select grouped by time bucket and the group columns.  If top_k is
+    given, a rank column is added that orders the groups in each bucket by
+    the first count column, using a window function so the limiting happens
+    in the database (see read_trend).
+    """
+    columns = [bucket_expr.label('bucket')] + group_columns + count_columns
+    if top_k is not None:
+        columns.append(sa.func.row_number().over(
+            partition_by=bucket_expr,
+            order_by=count_columns[0].element.desc()
+        ).label('rank'))
+    return sa.select(columns).group_by(bucket_expr, *group_columns)
+
+def read_trend(select, top_k=None):
+    """
+    Run a trend select and return the dataframe with bucket converted to a
+    timestamp.  If top_k is given, the select must include a rank column
+    (see trend_select) which is used to filter the rows.
+    """
+    if top_k is not None:
+        sub = select.alias('trend')
+        select = sa.select([c for c in sub.c if c.name != 'rank']).\
+            where(sub.c.rank <= top_k).\
+            order_by(sub.c.bucket, sub.c.rank)
+    else:
+        select = select.order_by(sa.text('bucket'))
+    df = pd.read_sql(select, db.engine)
+    df['bucket'] = pd.to_datetime(df['bucket'])
+    return df
+
 def notebooks():
     """
     Dataframe of metadata for all notebooks
@@ -85,18 +146,7 @@ def user_select_columns():
     columns like password.
     """
     u = orm.User.__table__
-    return [
-        u.c.id,
-        u.c.user_name,
-        u.c.email,
-        u.c.first_name,
-        u.c.last_name,
-        u.c.org,
-        u.c.created_at,
-        u.c.updated_at,
-        u.c.sign_in_count,
-        u.c.last_sign_in_at
-    ]
+    return [u.c[name] for name in db.user_columns]
 
 def users():
     """
@@ -237,6 +287,24 @@ def user_clicks_rollup(min_date=None, max_date=None, days_ago=None, user_id=None
     s = add_click_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id)
     return pd.read_sql(s, db.engine)
 
+def clicks_trend(bucket='day', by=('notebook_id', 'action'), top_k=None, min_date=None, max_date=None, days_ago=None, user_id=None, notebook_id=None, actions=None):
+    """
+    Dataframe with click counts per time bucket (hour, day, week or month),
+    grouped by any of user_id, notebook_id and action.  Bucketing and
+    counting happen in the database, so only the counts are transferred.  If
+    top_k is given, only the top_k groups per bucket are returned.
+    """
+    if isinstance(by, str):
+        by = [by]
+    t = orm.Click.__table__
+    group_columns = [t.c[column] for column in by]
+    count_columns = [sa.func.count(t.c.id).label('count')]
+    if 'user_id' not in by:
+        count_columns.append(sa.func.count(t.c.user_id.distinct()).label('users'))
+    s = trend_select(time_bucket(t.c.created_at, bucket), group_columns, count_columns, top_k)
+    s = add_click_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id, notebook_id=notebook_id, actions=actions)
+    return read_trend(s, top_k)
+
 def add_execution_filters(select, min_date=None, max_date=None, days_ago=None, user_id=None, notebook_id=None):
     """
     Add SQL filters for execution queries
@@ -282,7 +350,9 @@ def cell_execution_rollup(min_date=None, max_date=None, days_ago=None, user_id=N
         sa.func.count(executions.c.user_id.distinct()).label('users'),
         success := sa.cast(sa.func.sum(executions.c.success), sa.Integer).label('success'),
         count := sa.func.count(1).label('count'),
-        (success / count).label('pass_rate'),
+        ratio(success, count).label('pass_rate'),
+        sa.func.avg(executions.c.runtime).label('runtime_mean'),
+        sa.func.sum(executions.c.runtime).label('runtime_total'),
         sa.func.min(executions.c.created_at).label('first'),
         sa.func.max(executions.c.created_at).label('last')
     ]
@@ -290,6 +360,103 @@ def cell_execution_rollup(min_date=None, max_date=None, days_ago=None, user_id=N
     s = add_execution_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id, notebook_id=notebook_id)
     return pd.read_sql(s, db.engine)
 
+def iter_executions(chunksize=100000, min_date=None, max_date=None, days_ago=None, user_id=None, notebook_id=None):
+    """
+    Generator of execution dataframes (same columns as executions()) of at
+    most chunksize rows each, read in id order with keyset pagination so
+    the full result never has to fit in memory.
+    """
+    executions = orm.Execution.__table__
+    code_cells = orm.CodeCell.__table__
+    columns = [
+        executions.c.id,
+        executions.c.user_id,
+        executions.c.code_cell_id,
+        code_cells.c.notebook_id,
+        code_cells.c.cell_number,
+        executions.c.success,
+        executions.c.runtime,
+        executions.c.created_at.label('timestamp')
+    ]
+    s = sa.select(columns).select_from(executions.join(code_cells)).\
+        order_by(executions.c.id).limit(chunksize)
+    s = add_execution_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id, notebook_id=notebook_id)
+    last_id = None
+    while True:
+        page = s if last_id is None else s.where(executions.c.id > last_id)
+        df = pd.read_sql(page, db.engine)
+        if df.empty:
+            return
+        yield df
+        if len(df) < chunksize:
+            return
+        last_id = int(df['id'].iloc[-1])
+
+def runtime_bins():
+    """
+    Default runtime histogram bin edges in seconds, roughly logarithmic.
+    """
+    return [0, 0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 60, 300, 900, 3600]
+
+def cell_runtime_histogram(bins=None, min_date=None, max_date=None, days_ago=None, user_id=None, notebook_id=None):
+    """
+    Dataframe with one row per (code cell, runtime bin) with the number of
+    executions and failures whose runtime falls in that bin.  The binning is
+    done in the database.  Bin i covers [bins[i], bins[i+1]); runtimes at or
+    above the last edge go in the final bin.
+    """
+    if bins is None:
+        bins = runtime_bins()
+    bins = list(bins)
+    executions = orm.Execution.__table__
+    code_cells = orm.CodeCell.__table__
+    bin_column = sa.case(
+        [(executions.c.runtime < edge, i) for i, edge in enumerate(bins[1:])],
+        else_=len(bins) - 1
+    ).label('bin')
+    columns = [
+        executions.c.code_cell_id,
+        code_cells.c.notebook_id,
+        code_cells.c.cell_number,
+        bin_column,
+        count := sa.func.count(1).label('count'),
+        (count - sa.cast(sa.func.sum(executions.c.success), sa.Integer)).label('failures')
+    ]
+    s = sa.select(columns).select_from(executions.join(code_cells)).\
+        where(executions.c.runtime.isnot(None)).\
+        group_by(executions.c.code_cell_id, bin_column)
+    s = add_execution_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id, notebook_id=notebook_id)
+    return pd.read_sql(s, db.engine)
+
+def executions_trend(bucket='day', by=('notebook_id',), top_k=None, min_date=None, max_date=None, days_ago=None, user_id=None, notebook_id=None):
+    """
+    Dataframe with cell execution counts and pass rate per time bucket (hour,
+    day, week or month), grouped by any of user_id, notebook_id and
+    code_cell_id.  Bucketing and counting happen in the database.  If top_k is
+    given, only the top_k groups per bucket are returned.
+    """
+    if isinstance(by, str):
+        by = [by]
+    executions = orm.Execution.__table__
+    code_cells = orm.CodeCell.__table__
+    columns = {
+        'user_id': executions.c.user_id,
+        'notebook_id': code_cells.c.notebook_id,
+        'code_cell_id': executions.c.code_cell_id
+    }
+    group_columns = [columns[column] for column in by]
+    count_columns = [
+        count := sa.func.count(1).label('count'),
+        success := sa.cast(sa.func.sum(executions.c.success), sa.Integer).label('success'),
+        ratio(success, count).label('pass_rate')
+    ]
+    if 'user_id' not in by:
+        count_columns.append(sa.func.count(executions.c.user_id.distinct()).label('users'))
+    s = trend_select(time_bucket(executions.c.created_at, bucket), group_columns, count_columns, top_k)
+    s = s.select_from(executions.join(code_cells))
+    s = add_execution_filters(s, min_date=min_date, max_date=max_date, days_ago=days_ago, user_id=user_id, notebook_id=notebook_id)
+    return read_trend(s, top_k)
+
 def notebook_cell_count(label='cell_count'):
     """
     Dataframe with notebook_id and number of code cells per notebook.
@@ -314,7 +481,7 @@ def notebook_execution_rollup(min_date=None, max_date=None, days_ago=None, user_
         sa.func.count(code_cells.c.cell_number.distinct()).label('cells_executed'),
         success := sa.cast(sa.func.sum(executions.c.success), sa.Integer).label('cell_exec_success'),
         total := sa.func.count(1).label('cell_exec_count'),
-        (success / total).label('cell_pass_rate'),
+        ratio(success, total).label('cell_pass_rate'),
         sa.func.min(executions.c.created_at).label('first'),
         sa.func.max(executions.c.created_at).label('last')
     ]
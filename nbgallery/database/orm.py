@@ -100,3 +100,52 @@ Base.prepare(
 # Pull the rest of the reflected classes up into this namespace
 for cls in Base.classes:
     exec(f"{cls.__name__} = Base.classes.{cls.__name__}")
+
+def iter_keyset(session, model, *criterion, columns=None, page_size=1000):
+    """
+    Iterate over all rows of a mapped class in constant memory.
+
+    Rows are fetched in pages ordered by primary key, with each page starting
+    after the last key of the previous one (keyset pagination) rather than
+    using OFFSET.  Objects from each page are expunged from the session once
+    the page has been consumed, so the identity map doesn't grow without
+    bound; the session is flushed first so that changes made to those objects
+    are written rather than lost (they're committed with the session as
+    usual).  Optional criterion are passed to filter().
+
+    If columns are given (e.g. [Click.user_id, Click.notebook_id]), only those
+    columns are loaded and rows are returned instead of objects; the primary
+    key column is added as the first column if not already requested.
+    """
+    primary_key = sa.inspect(model).primary_key
+    if len(primary_key) != 1:
+        raise ValueError(f"{model.__name__} must have a single-column primary key")
+    key_name = primary_key[0].name
+    key = getattr(model, key_name)
+    if columns:
+        columns = list(columns)
+        if not any(c is key for c in columns):
+            columns.insert(0, key)
+        query = session.query(*columns)
+    else:
+        query = session.query(model)
+    query = query.filter(*criterion).order_by(key)
+
+    last = None
+    while True:
+        page = query if last is None else query.filter(key > last)
+        page = page.limit(page_size).yield_per(page_size)
+        loaded = []
+        for row in page:
+            loaded.append(row)
+            yield row
+        if not loaded:
+            return
+        last = getattr(loaded[-1], key_name)
+        if not columns:
+            session.flush()
+            for obj in loaded:
+                if obj in session:
+                    session.expunge(obj)
+        if len(loaded) < page_size:
+            return
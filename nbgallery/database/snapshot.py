@@ -0,0 +1,197 @@
+"""
+Snapshot export of the analytics tables to a local database.
+
+Ad-hoc exploration with the dataframes functions can put a lot of load on the
+production mysql server.  This module copies the analytics-relevant tables to
+a local embedded database (SQLite by default, or DuckDB if duckdb_engine is
+installed) given by snapshot_url in the nbgallery config.  Once a snapshot
+exists, set use_snapshot in the config and nbgallery.database.engine -- and
+therefore the ORM and dataframes modules -- will use the snapshot instead.
+
+Tables are read in id-ordered chunks, in parallel across tables.  Subsequent
+exports are incremental: only rows with a larger id than what's already in the
+snapshot, or an updated_at at or after its latest updated_at, are copied.
+Rows deleted from the mysql server are not removed from the snapshot by an
+incremental export; run a full export (--full) to pick up deletes.
+
+To run the export from the command line:
+
+    python -m nbgallery.database.snapshot [--full] [--tables notebooks clicks ...]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import threading
+
+import pandas as pd
+import sqlalchemy as sa
+
+import nbgallery.config as nbgcfg
+import nbgallery.database as nbgdb
+
+# Tables copied to the snapshot.  Groups aren't analytics data but are needed
+# for the partially-declared ORM classes to map.
+SNAPSHOT_TABLES = [
+    'notebooks',
+    'notebook_summaries',
+    'users',
+    'user_summaries',
+    'groups',
+    'clicks',
+    'executions',
+    'code_cells'
+]
+
+# Only copy these columns for tables that contain authentication data
+SNAPSHOT_COLUMNS = {
+    'users': nbgdb.user_columns
+}
+
+def snapshot_engine(url=None):
+    """
+    Return an engine for the snapshot database, creating the parent directory
+    of a file-based database if necessary.
+    """
+    url = sa.engine.url.make_url(url or nbgcfg.get_setting('snapshot_url'))
+    if url.database and url.drivername in ('sqlite', 'duckdb'):
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+    return sa.create_engine(url)
+
+def generic_type(column_type):
+    """
+    Convert a mysql column type to a generic SQLAlchemy type that the snapshot
+    database can represent.
+    """
+    try:
+        return column_type.as_generic()
+    except (AttributeError, NotImplementedError):
+        return sa.Text()
+
+def source_tables(tables=None, source=None):
+    """
+    Reflect the given tables from the mysql server, restricted to the snapshot
+    columns for tables listed in SNAPSHOT_COLUMNS.  Returns a dict of table
+    name => (source table, snapshot table).
+    """
+    source = source or nbgdb.get_mysql_engine()
+    tables = tables or SNAPSHOT_TABLES
+    source_metadata = sa.MetaData()
+    source_metadata.reflect(source, only=tables)
+    snapshot_metadata = sa.MetaData()
+    result = {}
+    for name in tables:
+        table = source_metadata.tables[name]
+        keep = SNAPSHOT_COLUMNS.get(name)
+        columns = [c for c in table.columns if keep is None or c.name in keep]
+        snapshot_table = sa.Table(name, snapshot_metadata, *[
+            sa.Column(c.name, generic_type(c.type), *snapshot_foreign_keys(c, tables), primary_key=c.primary_key)
+            for c in columns
+        ])
+        result[name] = (table, snapshot_table)
+    return result
+
+def snapshot_foreign_keys(column, tables):
+    """
+    Copies of a reflected column's foreign keys that point at tables inside
+    the snapshot.  These are needed for joins like executions.join(code_cells)
+    in the dataframes module to work against the snapshot.
+    """
+    return [
+        sa.ForeignKey(f"{fk.column.table.name}.{fk.column.name}")
+        for fk in column.foreign_keys
+        if fk.column.table.name in tables
+    ]
+
+def export_table(source, dest, source_table, dest_table, chunksize=50000, lock=None):
+    """
+    Copy new and updated rows of one table to the snapshot in id-ordered
+    chunks.  Writes are serialized with lock, since embedded databases
+    generally allow only one writer.  Returns the number of rows copied.
+    """
+    lock = lock or threading.Lock()
+    src = source_table.c
+    columns = [src[c.name] for c in dest_table.columns]
+    has_updated_at = 'updated_at' in dest_table.c
+
+    # Determine where the previous export left off
+    with lock:
+        dest_table.create(dest, checkfirst=True)
+        bounds = [sa.func.max(dest_table.c.id)]
+        if has_updated_at:
+            bounds.append(sa.func.max(dest_table.c.updated_at))
+        with dest.connect() as conn:
+            row = conn.execute(sa.select(bounds)).fetchone()
+    max_id = row[0]
+    max_updated_at = row[1] if has_updated_at else None
+
+    condition = None
+    if max_id is not None:
+        condition = src.id > max_id
+        if max_updated_at is not None:
+            # >= catches rows updated in the same second as the previous
+            # export; rows already in the snapshot are replaced by id.
+            condition = sa.or_(condition, src.updated_at >= max_updated_at)
+
+    copied = 0
+    last_id = None
+    while True:
+        s = sa.select(columns).order_by(src.id).limit(chunksize)
+        if condition is not None:
+            s = s.where(condition)
+        if last_id is not None:
+            s = s.where(src.id > last_id)
+        df = pd.read_sql(s, source)
+        if df.empty:
+            break
+        last_id = int(df['id'].iloc[-1])
+        with lock:
+            with dest.begin() as conn:
+                if max_id is not None:
+                    # Replace rows that were updated since the last export
+                    updated = df['id'][df['id'] <= max_id].tolist()
+                    if updated:
+                        conn.execute(dest_table.delete().where(dest_table.c.id.in_(updated)))
+                df.to_sql(dest_table.name, conn, if_exists='append', index=False)
+        copied += len(df)
+        if len(df) < chunksize:
+            break
+    return copied
+
+def export(tables=None, url=None, full=False, chunksize=50000, max_workers=4, source=None):
+    """
+    Export tables from the mysql server (or another source engine) to the
+    snapshot database.  By default the export is incremental; set full to
+    drop and recreate the snapshot tables.  Returns a dict of table name =>
+    number of rows copied.
+    """
+    source = source or nbgdb.get_mysql_engine()
+    dest = snapshot_engine(url)
+    pairs = source_tables(tables, source)
+    metadata = next(iter(pairs.values()))[1].metadata
+    if full:
+        metadata.drop_all(dest)
+    metadata.create_all(dest)
+
+    lock = threading.Lock()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(export_table, source, dest, src, dst, chunksize, lock)
+            for name, (src, dst) in pairs.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Export nbgallery analytics tables to a local snapshot')
+    parser.add_argument('--url', help='SQLAlchemy URL of the snapshot database (default: snapshot_url from config)')
+    parser.add_argument('--tables', nargs='+', default=SNAPSHOT_TABLES, help='tables to export')
+    parser.add_argument('--full', action='store_true', help='drop and recreate the snapshot tables')
+    parser.add_argument('--chunksize', type=int, default=50000, help='rows per chunk')
+    parser.add_argument('--workers', type=int, default=4, help='number of tables to read in parallel')
+    args = parser.parse_args()
+    counts = export(args.tables, args.url, args.full, args.chunksize, args.workers)
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+
+if __name__ == '__main__':
+    main()
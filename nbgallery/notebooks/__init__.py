@@ -11,6 +11,9 @@ instantiate a document directly.
 The NotebookDocument interface is a light abstraction in case support for
 additional notebook types is added to nbgallery (iodide, RStudio, etc.).
 Currently only Jupyter notebooks (ipynb format) are supported.
+
+See also the submodule:
+ * nbgallery.notebooks.dedup: content-hash deduplication of notebook documents
 """
 
 import os
@@ -25,21 +28,43 @@ def from_model(model):
     Load a notebook from an nbgallery ORM Notebook model.  The
     notebook_cache_dir must be set in config.
     """
-    uuid = model.uuid
-    notebook_type = 'jupyter'
-    return from_uuid(uuid, notebook_type)
+    return from_file(model_filename(model), 'jupyter')
+
+def from_models(models):
+    """
+    Generator of (model, notebook) pairs for an iterable of ORM Notebook
+    models.  Notebooks whose document can't be loaded from the cache (missing
+    or malformed file) are skipped.
+    """
+    for model in models:
+        try:
+            doc = from_model(model)
+        except (OSError, ValueError):
+            continue
+        yield (model, doc)
 
 def from_uuid(uuid, notebook_type):
     """
     Load a notebook using its nbgallery uuid. The notebook_cache_dir must be
     set in config; file extension is determined from notebook type.
     """
-    cache = nbgcfg.config['nbgallery'].get('notebook_cache_dir')
+    return from_file(cache_filename(uuid, notebook_type), notebook_type)
+
+def cache_filename(uuid, notebook_type):
+    """
+    Return the path of a notebook's file in the notebook_cache_dir.
+    """
+    cache = nbgcfg.get_setting('notebook_cache_dir')
     if not cache:
         raise RuntimeError('notebook_cache_dir must be set in config')
     basename = uuid + '.' + type_to_extension(notebook_type)
-    filename = os.path.join(cache, basename)
-    return from_file(filename, notebook_type)
+    return os.path.join(cache, basename)
+
+def model_filename(model):
+    """
+    Return the path of the cached file for an nbgallery ORM Notebook model.
+    """
+    return cache_filename(model.uuid, 'jupyter')
 
 def from_file(filename, notebook_type=None):
     """
@@ -0,0 +1,209 @@
+"""
+Content-hash deduplication of notebook documents.
+
+Many notebooks in a gallery are forks or re-uploads of the same content.  This
+module builds an index of normalized content hashes so batch jobs (similarity,
+topic modeling, feature extraction) can process each unique notebook once and
+fan the results back out to every notebook id that shares that content.
+
+Two levels of hashing are used:
+
+  * A notebook-level hash over all cleaned code sources, for exact duplicates.
+  * Per-cell hashes, for partial overlap between notebooks that share some but
+    not all of their code.
+
+Sources are normalized before hashing so that trailing whitespace, blank lines
+and line-ending differences don't defeat the match.
+"""
+
+import hashlib
+import os
+from collections import defaultdict
+
+import pandas as pd
+
+import nbgallery.notebooks as nbgnb
+
+def normalize_source(source):
+    """
+    Normalize a cell source for hashing: strip trailing whitespace from each
+    line, drop blank lines and normalize line endings.
+    """
+    lines = (line.rstrip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def cell_hash(source):
+    """
+    Return the hex digest of a normalized cell source.  Returns None for cells
+    that are empty after normalization.
+    """
+    normalized = normalize_source(source)
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def cell_hashes(doc):
+    """
+    Return the list of hashes for the non-empty code cells of a notebook
+    document, in cell order.
+    """
+    hashes = (cell_hash(source) for source in doc.code_sources())
+    return [h for h in hashes if h is not None]
+
+def content_hash(doc, hashes=None):
+    """
+    Return the notebook-level hash of a document, computed over its normalized
+    code cells.  Notebooks with identical code (ignoring outputs, markdown and
+    whitespace) get the same hash.  Pass precomputed cell hashes to avoid
+    hashing the sources twice.
+
+    Notebooks without any code fall back to a hash of their whole content, so
+    unrelated markdown-only or empty notebooks aren't grouped together.
+    """
+    if hashes is None:
+        hashes = cell_hashes(doc)
+    if not hashes:
+        return hashlib.sha1(('content:' + doc.content()).encode('utf-8')).hexdigest()
+    return hashlib.sha1('\n'.join(hashes).encode('utf-8')).hexdigest()
+
+class DedupIndex:
+    """
+    Index of notebook ids by normalized content hash.
+
+    Add documents with add() or build one from ORM models with from_models().
+    Use representatives() to get one notebook id per unique content, then
+    fan_out() to copy results computed for the representatives back to every
+    duplicate.
+    """
+
+    def __init__(self):
+        self.content = {}                  # notebook id => content hash
+        self.cells = {}                    # notebook id => list of cell hashes
+        self.sizes = {}                    # notebook id => size in bytes
+        self.groups = defaultdict(list)    # content hash => notebook ids
+        self.cell_index = defaultdict(set) # cell hash => notebook ids
+
+    def __len__(self):
+        return len(self.content)
+
+    def __contains__(self, notebook_id):
+        return notebook_id in self.content
+
+    def add(self, notebook_id, doc, size=None):
+        """
+        Add a notebook document to the index.  The size in bytes is used for
+        storage statistics and should be the size of the stored file; if not
+        given, it is estimated from the serialized document content.
+        """
+        if notebook_id in self.content:
+            self.remove(notebook_id)
+        hashes = cell_hashes(doc)
+        digest = content_hash(doc, hashes)
+        if size is None:
+            size = len(doc.content().encode('utf-8'))
+        self.content[notebook_id] = digest
+        self.cells[notebook_id] = hashes
+        self.sizes[notebook_id] = size
+        self.groups[digest].append(notebook_id)
+        for h in hashes:
+            self.cell_index[h].add(notebook_id)
+        return digest
+
+    def remove(self, notebook_id):
+        """
+        Remove a notebook from the index.
+        """
+        digest = self.content.pop(notebook_id)
+        self.groups[digest].remove(notebook_id)
+        if not self.groups[digest]:
+            del self.groups[digest]
+        for h in self.cells.pop(notebook_id):
+            self.cell_index[h].discard(notebook_id)
+            if not self.cell_index[h]:
+                del self.cell_index[h]
+        del self.sizes[notebook_id]
+
+    @classmethod
+    def from_models(cls, models):
+        """
+        Build an index from an iterable of ORM Notebook models (see
+        nbgallery.notebooks.from_models).  Sizes are taken from the files in
+        the notebook cache.
+        """
+        index = cls()
+        for model, doc in nbgnb.from_models(models):
+            index.add(model.id, doc, os.path.getsize(nbgnb.model_filename(model)))
+        return index
+
+    def duplicates(self, notebook_id):
+        """
+        Return the other notebook ids with the same content as this one.
+        """
+        digest = self.content[notebook_id]
+        return [i for i in self.groups[digest] if i != notebook_id]
+
+    def representatives(self):
+        """
+        Return a dict of content hash => representative notebook id (the
+        lowest id sharing that content).  Batch jobs only need to process
+        these notebooks.
+        """
+        return {digest: min(ids) for digest, ids in self.groups.items()}
+
+    def fan_out(self, results):
+        """
+        Given a dict of representative notebook id => result, return a dict
+        with the result copied to every notebook id that shares the same
+        content.
+        """
+        fanned = {}
+        for digest, ids in self.groups.items():
+            rep = min(ids)
+            if rep in results:
+                for i in ids:
+                    fanned[i] = results[rep]
+        return fanned
+
+    def overlap(self, notebook_id):
+        """
+        Return a dict of other notebook id => fraction of this notebook's
+        code cells that also appear in the other notebook.
+        """
+        hashes = self.cells[notebook_id]
+        if not hashes:
+            return {}
+        shared = defaultdict(int)
+        for h in hashes:
+            for other in self.cell_index[h]:
+                if other != notebook_id:
+                    shared[other] += 1
+        return {other: count / len(hashes) for other, count in shared.items()}
+
+    def dataframe(self):
+        """
+        Dataframe with one row per notebook: content hash, number of code
+        cells, size in bytes and the size of its duplicate group.
+        """
+        df = pd.DataFrame({
+            'notebook_id': list(self.content.keys()),
+            'content_hash': list(self.content.values())
+        })
+        df['cells'] = df['notebook_id'].map(lambda i: len(self.cells[i]))
+        df['size'] = df['notebook_id'].map(self.sizes)
+        df['copies'] = df['content_hash'].map(lambda h: len(self.groups[h]))
+        return df
+
+    def stats(self):
+        """
+        Summary of duplication: total and unique notebook counts, total bytes
+        and bytes taken up by duplicate copies.
+        """
+        total_size = sum(self.sizes.values())
+        unique_size = sum(self.sizes[min(ids)] for ids in self.groups.values())
+        return {
+            'notebooks': len(self.content),
+            'unique_notebooks': len(self.groups),
+            'duplicate_notebooks': len(self.content) - len(self.groups),
+            'total_size': total_size,
+            'duplicate_size': total_size - unique_size
+        }
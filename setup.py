@@ -26,5 +26,13 @@ setup(
         'SQLAlchemy',
         'sqlalchemy-mixins',
         'SQLAlchemy-Utils'
-    ]
+    ],
+    extras_require={
+        'analytics': [
+            'joblib',
+            'numpy',
+            'scikit-learn',
+            'scipy'
+        ]
+    }
 )
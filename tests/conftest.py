@@ -0,0 +1,148 @@
+"""
+Shared test database.
+
+A small SQLite database with the nbgallery schema stands in for the mysql
+server.  It is exported to a SQLite snapshot and the config is pointed at the
+snapshot before any test module is imported, since nbgallery.database.orm
+reflects the database on import.  The config can only be set once per
+process (see nbgallery.config.set_config), so every test shares this setup.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import pytest
+import sqlalchemy as sa
+
+import nbgallery.config as nbgcfg
+import nbgallery.database.snapshot as snapshot
+
+_directory = None
+
+def source_database(url):
+    engine = sa.create_engine(url)
+    metadata = sa.MetaData()
+    timestamps = lambda: [sa.Column('created_at', sa.DateTime), sa.Column('updated_at', sa.DateTime)]
+    sa.Table('users', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_name', sa.String(255)),
+        sa.Column('email', sa.String(255)),
+        sa.Column('first_name', sa.String(255)),
+        sa.Column('last_name', sa.String(255)),
+        sa.Column('org', sa.String(255)),
+        sa.Column('sign_in_count', sa.Integer),
+        sa.Column('last_sign_in_at', sa.DateTime),
+        sa.Column('encrypted_password', sa.String(255)),
+        *timestamps())
+    sa.Table('groups', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(255)),
+        *timestamps())
+    sa.Table('notebooks', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('uuid', sa.String(255)),
+        sa.Column('title', sa.String(255)),
+        sa.Column('creator_id', sa.Integer, sa.ForeignKey('users.id')),
+        sa.Column('updater_id', sa.Integer, sa.ForeignKey('users.id')),
+        sa.Column('owner_id', sa.Integer),
+        sa.Column('owner_type', sa.String(255)),
+        *timestamps())
+    sa.Table('notebook_summaries', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('notebook_id', sa.Integer, sa.ForeignKey('notebooks.id')),
+        sa.Column('views', sa.Integer),
+        *timestamps())
+    sa.Table('user_summaries', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id')),
+        sa.Column('score', sa.Float),
+        *timestamps())
+    sa.Table('clicks', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id')),
+        sa.Column('notebook_id', sa.Integer, sa.ForeignKey('notebooks.id')),
+        sa.Column('action', sa.String(255)),
+        *timestamps())
+    sa.Table('code_cells', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('notebook_id', sa.Integer, sa.ForeignKey('notebooks.id')),
+        sa.Column('cell_number', sa.Integer),
+        *timestamps())
+    sa.Table('executions', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id')),
+        sa.Column('code_cell_id', sa.Integer, sa.ForeignKey('code_cells.id')),
+        sa.Column('success', sa.Boolean),
+        sa.Column('runtime', sa.Float),
+        *timestamps())
+    metadata.create_all(engine)
+
+    t = metadata.tables
+    now = datetime.datetime(2020, 6, 1, 12, 0, 0)
+    with engine.begin() as conn:
+        conn.execute(t['users'].insert(), [
+            {'id': i, 'user_name': f"user{i}", 'encrypted_password': 'secret', 'created_at': now, 'updated_at': now}
+            for i in (1, 2)
+        ])
+        conn.execute(t['notebooks'].insert(), [
+            {'id': i, 'uuid': f"uuid{i}", 'title': f"Test {i}", 'creator_id': 1, 'updater_id': 1, 'owner_id': 1, 'owner_type': 'User', 'created_at': now, 'updated_at': now}
+            for i in (1, 2)
+        ])
+        conn.execute(t['clicks'].insert(), [
+            {
+                'id': i,
+                'user_id': 1 + i % 2,
+                'notebook_id': 1 if i % 3 else 2,
+                'action': 'downloaded notebook' if i % 4 == 0 else 'viewed notebook',
+                'created_at': now + datetime.timedelta(days=i),
+                'updated_at': now + datetime.timedelta(days=i)
+            }
+            for i in range(1, 13)
+        ] + [
+            {'id': 13, 'user_id': 1, 'notebook_id': 1, 'action': 'starred notebook', 'created_at': now, 'updated_at': now}
+        ])
+        conn.execute(t['code_cells'].insert(), [
+            {'id': i, 'notebook_id': 1, 'cell_number': i - 1, 'created_at': now, 'updated_at': now}
+            for i in (1, 2)
+        ])
+        conn.execute(t['executions'].insert(), [
+            {
+                'id': i,
+                'user_id': 1 + i % 2,
+                'code_cell_id': 1 + i % 2,
+                'success': i % 4 != 0,
+                'runtime': 0.5 * i,
+                'created_at': now + datetime.timedelta(days=i),
+                'updated_at': now + datetime.timedelta(days=i)
+            }
+            for i in range(1, 21)
+        ])
+    return engine
+
+def pytest_configure(config):
+    global _directory
+    _directory = tempfile.mkdtemp()
+    source = source_database(f"sqlite:///{os.path.join(_directory, 'source.db')}")
+    snapshot_url = f"sqlite:///{os.path.join(_directory, 'snapshot.db')}"
+    snapshot.export(url=snapshot_url, source=source, max_workers=2, chunksize=7)
+    nbgcfg.set_config(use_snapshot=True, snapshot_url=snapshot_url)
+
+def pytest_unconfigure(config):
+    if _directory:
+        shutil.rmtree(_directory, ignore_errors=True)
+
+@pytest.fixture(scope='session')
+def source():
+    """
+    Engine for the source database the snapshot was exported from.
+    """
+    return sa.create_engine(f"sqlite:///{os.path.join(_directory, 'source.db')}")
+
+@pytest.fixture(scope='session')
+def snapshot_url():
+    """
+    URL of the snapshot database the config points at.
+    """
+    return nbgcfg.get_setting('snapshot_url')
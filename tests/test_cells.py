@@ -0,0 +1,24 @@
+"""
+Cell-level execution analytics against the test snapshot.
+"""
+
+import numpy as np
+import pytest
+
+cells = pytest.importorskip('nbgallery.analytics.cells')
+
+bins = np.array([0, 1, 5, 100])
+
+def test_runtime_percentiles_column_names():
+    pct = cells.runtime_percentiles(percentiles=(0.5, 0.995, 0.999), bins=bins)
+    assert {'p50', 'p99.5', 'p99.9'} <= set(pct.columns)
+    assert (pct['p99.9'] >= pct['p99.5']).all()
+
+def test_cell_stats_from_executions():
+    stats = cells.CellStats.from_executions(chunksize=6, bins=bins).dataframe()
+    assert stats['count'].tolist() == [10, 10]
+    assert stats['pass_rate'].tolist() == [0.5, 1.0]
+
+def test_hot_cells_unknown_notebook():
+    with pytest.raises(RuntimeError):
+        cells.hot_cells(999)
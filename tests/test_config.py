@@ -0,0 +1,87 @@
+"""
+Config loading and precedence.  load_config doesn't touch the shared config
+set up in conftest.py.
+"""
+
+import pytest
+
+import nbgallery.config as nbgcfg
+import nbgallery.config.loader as loader
+import nbgallery.database as nbgdb
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    for s in loader.settings + ['config']:
+        monkeypatch.delenv(loader.env_prefix + s.upper(), raising=False)
+
+@pytest.fixture
+def config_file(tmp_path):
+    rails_config = tmp_path / 'rails.yml'
+    rails_config.write_text(
+        'mysql:\n'
+        '  username: rails_user\n'
+        '  password: rails_password\n'
+        '  host: rails_host\n'
+        '  database: rails_database\n'
+        'directories:\n'
+        '  cache: /rails/cache\n'
+    )
+    filename = tmp_path / 'nbgallery.yml'
+    filename.write_text(
+        'nbgallery:\n'
+        f"  rails_config: {rails_config}\n"
+        '  mysql_username: file_user\n'
+        '  mysql_host: file_host\n'
+        '  mysql_database: file_database\n'
+    )
+    return str(filename)
+
+def test_defaults(tmp_path):
+    filename = tmp_path / 'nbgallery.yml'
+    filename.write_text('nbgallery:\n  mysql_username: user\n')
+    nbg = loader.load_config(str(filename))['nbgallery']
+    assert nbg['mysql_host'] == '127.0.0.1'
+    assert nbg['mysql_port'] == '3306'
+    assert nbg['use_snapshot'] is False
+    assert nbg['snapshot_url'].startswith('sqlite:///')
+
+def test_file_and_rails_config(config_file):
+    nbg = loader.load_config(config_file)['nbgallery']
+    assert nbg['mysql_username'] == 'file_user'
+    assert nbg['mysql_host'] == 'file_host'
+    # Settings missing from the file come from the Rails config
+    assert nbg['mysql_password'] == 'rails_password'
+    assert nbg['notebook_cache_dir'] == '/rails/cache'
+
+def test_environment_overrides_file(config_file, monkeypatch):
+    monkeypatch.setenv('NBGALLERY_MYSQL_HOST', 'env_host')
+    monkeypatch.setenv('NBGALLERY_MYSQL_PASSWORD', 'env_password')
+    nbg = loader.load_config(config_file)['nbgallery']
+    assert nbg['mysql_host'] == 'env_host'
+    assert nbg['mysql_password'] == 'env_password'
+    assert nbg['mysql_username'] == 'file_user'
+
+def test_overrides_take_precedence(config_file, monkeypatch):
+    monkeypatch.setenv('NBGALLERY_MYSQL_HOST', 'env_host')
+    overrides = {'mysql_host': 'override_host', 'mysql_database': None}
+    nbg = loader.load_config(config_file, overrides)['nbgallery']
+    assert nbg['mysql_host'] == 'override_host'
+    # None overrides are ignored
+    assert nbg['mysql_database'] == 'file_database'
+
+def test_config_file_from_environment(config_file, monkeypatch):
+    monkeypatch.setenv('NBGALLERY_CONFIG', config_file)
+    assert loader.find_config_file() == config_file
+    assert loader.load_config()['nbgallery']['mysql_username'] == 'file_user'
+
+@pytest.mark.parametrize('value,expected', [('true', True), ('1', True), ('no', False), ('', False)])
+def test_use_snapshot_from_environment(tmp_path, monkeypatch, value, expected):
+    monkeypatch.setenv('NBGALLERY_USE_SNAPSHOT', value)
+    filename = tmp_path / 'nbgallery.yml'
+    filename.write_text('nbgallery:\n  use_snapshot:\n')
+    assert loader.load_config(str(filename))['nbgallery']['use_snapshot'] is expected
+
+def test_set_config_locked_after_engine_created():
+    nbgdb.get_engine()
+    with pytest.raises(RuntimeError):
+        nbgcfg.set_config(mysql_host='elsewhere')
@@ -0,0 +1,35 @@
+"""
+Keyset-paginated iteration over ORM classes against the test snapshot.
+"""
+
+import pytest
+
+import nbgallery.database.orm as nbgorm
+
+@pytest.fixture
+def session():
+    session = nbgorm.Session()
+    yield session
+    session.rollback()
+    session.close()
+
+def test_iter_keyset_order(session):
+    ids = [e.id for e in nbgorm.iter_keyset(session, nbgorm.Execution, page_size=6)]
+    assert ids == list(range(1, 21))
+    assert len(session.identity_map) == 0
+
+def test_iter_keyset_criterion(session):
+    rows = nbgorm.iter_keyset(session, nbgorm.Execution, nbgorm.Execution.user_id == 1, page_size=4)
+    assert [e.id for e in rows] == list(range(2, 21, 2))
+
+def test_iter_keyset_columns(session):
+    rows = list(nbgorm.iter_keyset(session, nbgorm.Click, columns=[nbgorm.Click.action], page_size=5))
+    assert [tuple(row) for row in rows[:2]] == [(1, 'viewed notebook'), (2, 'viewed notebook')]
+    assert len(rows) == 13
+    assert len(session.identity_map) == 0
+
+def test_iter_keyset_flushes_changes(session):
+    for click in nbgorm.iter_keyset(session, nbgorm.Click, page_size=5):
+        click.action = 'changed'
+    assert len(session.identity_map) == 0
+    assert session.query(nbgorm.Click).filter(nbgorm.Click.action == 'changed').count() == 13
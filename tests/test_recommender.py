@@ -0,0 +1,31 @@
+"""
+Recommendation scoring on a small synthetic interaction matrix.
+"""
+
+import numpy as np
+import pytest
+
+sparse = pytest.importorskip('scipy.sparse')
+recommender = pytest.importorskip('nbgallery.analytics.recommender')
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    ratings = rng.random((50, 20)) * (rng.random((50, 20)) < 0.2)
+    return sparse.csr_matrix(ratings.astype(np.float32))
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_top_n_blocks_match_single_block(matrix, n_jobs):
+    S = recommender.item_similarity(matrix)
+    expected = recommender.top_n(matrix, S, n=5, n_jobs=1, block_size=1000)
+    result = recommender.top_n(matrix, S, n=5, n_jobs=n_jobs, block_size=7)
+    for a, b in zip(expected, result):
+        np.testing.assert_array_equal(a, b)
+    assert len(result[0]) == matrix.shape[0] + 1
+
+def test_top_n_excludes_seen_notebooks(matrix):
+    S = recommender.item_similarity(matrix)
+    indptr, columns, _ = recommender.top_n(matrix, S, n=5, n_jobs=1)
+    for i in range(matrix.shape[0]):
+        seen = set(matrix[i].indices)
+        assert not seen & set(columns[indptr[i]:indptr[i + 1]])
@@ -0,0 +1,67 @@
+"""
+Export to a SQLite snapshot, and the execution rollups against it.
+
+The shared source database and snapshot are set up in conftest.py.
+"""
+
+import pytest
+import sqlalchemy as sa
+import sqlalchemy.dialects.mysql
+
+import nbgallery.database.dataframes as nbgdf
+import nbgallery.database.snapshot as snapshot
+
+@pytest.fixture
+def export_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'snapshot.db'}"
+
+def test_export_skips_auth_columns(source, export_url):
+    counts = snapshot.export(url=export_url, source=source, max_workers=2, chunksize=7)
+    assert counts['executions'] == 20
+    assert counts['users'] == 2
+    columns = sa.inspect(sa.create_engine(export_url)).get_columns('users')
+    assert 'encrypted_password' not in [c['name'] for c in columns]
+
+def test_export_keeps_foreign_keys(source, export_url):
+    snapshot.export(url=export_url, source=source, tables=['code_cells', 'executions'])
+    foreign_keys = sa.inspect(sa.create_engine(export_url)).get_foreign_keys('executions')
+    # users isn't in the exported tables, so only the code_cells key is kept
+    assert [fk['referred_table'] for fk in foreign_keys] == ['code_cells']
+
+def test_incremental_export(source, export_url):
+    snapshot.export(url=export_url, source=source, tables=['users'])
+    users = sa.Table('users', sa.MetaData(), autoload_with=source)
+    # Same updated_at as the previous high-water mark
+    with source.begin() as conn:
+        conn.execute(users.update().where(users.c.id == 2).values(first_name='Changed'))
+    try:
+        counts = snapshot.export(url=export_url, source=source, tables=['users'])
+        assert counts['users'] == 2
+        with sa.create_engine(export_url).connect() as conn:
+            rows = conn.execute(sa.text('SELECT id, first_name FROM users ORDER BY id')).fetchall()
+        assert [tuple(row) for row in rows] == [(1, None), (2, 'Changed')]
+    finally:
+        with source.begin() as conn:
+            conn.execute(users.update().where(users.c.id == 2).values(first_name=None))
+
+def test_executions():
+    assert len(nbgdf.executions()) == 20
+    assert sum(len(df) for df in nbgdf.iter_executions(chunksize=6)) == 20
+
+def test_cell_execution_rollup():
+    rollup = nbgdf.cell_execution_rollup().set_index('code_cell_id')
+    assert rollup['count'].tolist() == [10, 10]
+    assert rollup.loc[1, 'pass_rate'] == 0.5
+    assert rollup.loc[2, 'pass_rate'] == 1
+
+def test_notebook_execution_rollup():
+    assert nbgdf.notebook_execution_rollup()['cell_pass_rate'].tolist() == [0.75]
+
+def test_pass_rate_compiles_without_cast_on_mysql():
+    expression = nbgdf.ratio(sa.literal_column('success'), sa.literal_column('count'))
+    sql = str(expression.compile(dialect=sa.dialects.mysql.dialect()))
+    assert 'CAST' not in sql
+
+def test_cell_runtime_histogram():
+    hist = nbgdf.cell_runtime_histogram()
+    assert hist['count'].sum() == 20
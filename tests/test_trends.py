@@ -0,0 +1,46 @@
+"""
+Time-bucketed click and execution trends against the test snapshot.
+"""
+
+import warnings
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.mysql
+
+import nbgallery.database.dataframes as nbgdf
+
+def test_executions_trend():
+    trend = nbgdf.executions_trend(bucket='month', by='code_cell_id')
+    assert trend['count'].sum() == 20
+    passed = trend.groupby('code_cell_id').apply(lambda df: (df['pass_rate'] * df['count']).sum())
+    assert passed.tolist() == [5, 10]
+
+def test_executions_trend_top_k():
+    top = nbgdf.executions_trend(bucket='month', by='code_cell_id', top_k=1)
+    assert top.groupby('bucket').size().max() == 1
+
+def test_clicks_trend():
+    trend = nbgdf.clicks_trend(bucket='month', by='notebook_id')
+    # The starred click isn't one of the default actions
+    assert trend['count'].sum() == 12
+    assert trend.groupby('notebook_id')['count'].sum().tolist() == [8, 4]
+    assert set(trend['bucket'].dt.month) == {6}
+
+def test_clicks_trend_by_action():
+    trend = nbgdf.clicks_trend(bucket='week', by=('notebook_id', 'action'))
+    counts = trend.groupby('action')['count'].sum()
+    assert counts.to_dict() == {'downloaded notebook': 3, 'viewed notebook': 9}
+    assert (trend['bucket'].dt.dayofweek == 0).all()
+
+def test_clicks_trend_top_k():
+    top = nbgdf.clicks_trend(bucket='month', by='notebook_id', top_k=1)
+    assert top['notebook_id'].tolist() == [1]
+    assert top['count'].tolist() == [8]
+
+def test_executions_trend_compiles_on_mysql(monkeypatch):
+    monkeypatch.setattr(nbgdf, 'read_trend', lambda select, top_k=None: select)
+    select = nbgdf.executions_trend(bucket='day', by='code_cell_id')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', sa.exc.SAWarning)
+        sql = str(select.compile(dialect=sa.dialects.mysql.dialect()))
+    assert 'AS FLOAT' not in sql